@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import csv
 from io import StringIO, BytesIO
@@ -10,7 +11,9 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, MessageHandler, filters
 )
 import config
-from main import SimilarChannelParser, parse_username_from_line, parse_line_to_dict
+import profiling
+from main import SimilarChannelParser, parse_username_from_line, parse_line_to_dict, safe_filename, threshold_label
+from ranking import Level2Ranker
 
 # Список авторизованных пользователей
 AUTHORIZED_USERS = [501410189, 480322199]  # lalimi, illiaholovko
@@ -108,34 +111,35 @@ async def ask_channel_level1(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     await update.message.reply_text("⏳ Запускаю парсинг Level 1, подождите…")
 
-    try:
-        channels = await parser.get_similar_channels(username)
-        if not channels:
-            await update.message.reply_text("Похожие каналы не найдены.", reply_markup=get_main_keyboard(user_id))
-        else:
-            # Генерируем CSV-таблицу
-            output = StringIO()
-            writer = csv.DictWriter(
-                output,
-                fieldnames=["Ссылка", "Кол-во подписчиков", "Название канала"],
-                delimiter=","
-            )
-            writer.writeheader()
-            for line in channels:
-                parsed = parse_line_to_dict(line, config.LINE_FORMAT)
-                if parsed:
-                    writer.writerow({
-                        "Ссылка": f"https://t.me/{parsed.get('username')}",
-                        "Кол-во подписчиков": parsed.get("participants_count"),
-                        "Название канала": parsed.get("title"),
-                    })
-            csv_bytes = BytesIO(output.getvalue().encode("utf-8"))
-            csv_bytes.name = f"{username}_level1_report.csv"
-            csv_bytes.seek(0)
-            await update.message.reply_document(document=csv_bytes, filename=csv_bytes.name)
-            await update.message.reply_text("Готово! Вот ваш Level 1 отчёт.", reply_markup=get_main_keyboard(user_id))
-    except Exception as exc:
-        await update.message.reply_text(f"Ошибка: {exc}", reply_markup=get_main_keyboard(user_id))
+    with profiling.job(f"{safe_filename(username)}_level1"):
+        try:
+            channels = await parser.get_similar_channels(username)
+            if not channels:
+                await update.message.reply_text("Похожие каналы не найдены.", reply_markup=get_main_keyboard(user_id))
+            else:
+                # Генерируем CSV-таблицу
+                output = StringIO()
+                writer = csv.DictWriter(
+                    output,
+                    fieldnames=["Ссылка", "Кол-во подписчиков", "Название канала"],
+                    delimiter=","
+                )
+                writer.writeheader()
+                for line in channels:
+                    parsed = parse_line_to_dict(line, config.LINE_FORMAT)
+                    if parsed:
+                        writer.writerow({
+                            "Ссылка": f"https://t.me/{parsed.get('username')}",
+                            "Кол-во подписчиков": parsed.get("participants_count"),
+                            "Название канала": parsed.get("title"),
+                        })
+                csv_bytes = BytesIO(output.getvalue().encode("utf-8"))
+                csv_bytes.name = f"{username}_level1_report.csv"
+                csv_bytes.seek(0)
+                await update.message.reply_document(document=csv_bytes, filename=csv_bytes.name)
+                await update.message.reply_text("Готово! Вот ваш Level 1 отчёт.", reply_markup=get_main_keyboard(user_id))
+        except Exception as exc:
+            await update.message.reply_text(f"Ошибка: {exc}", reply_markup=get_main_keyboard(user_id))
 
     return ConversationHandler.END
 async def ask_channel_level2(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -162,65 +166,79 @@ async def ask_channel_level2(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
     async def do_parsing_and_send(user_id, username, wait_msg_id, context):
-        try:
-            channels_l1 = await parser.get_similar_channels(username)
-            if not channels_l1:
-                await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
-                await context.bot.send_message(user_id, "На первом уровне похожих каналов не найдено.")
-                return
-
-            level2_data = []
-            for line in channels_l1:
-                uname = parse_username_from_line(line, config.LINE_FORMAT)
-                if uname:
-                    channels_l2 = await parser.get_similar_channels(uname)
-                    for l2 in channels_l2:
-                        parsed = parse_line_to_dict(l2, config.LINE_FORMAT)
-                        if parsed:
-                            subs = parsed.get("participants_count")
-                            try:
-                                subs_num = int(str(subs).replace(" ", ""))
-                            except Exception:
-                                subs_num = 0
-                            over_50k_value = subs_num if subs_num > 50000 else ""
-                            level2_data.append({
-                                "Исходный канал": uname,
-                                "Ссылка": f"https://t.me/{parsed.get('username')}",
-                                "Кол-во подписчиков": parsed.get("participants_count"),
-                                "Название канала": parsed.get("title"),
-                                "Подписчиков свыше 50k": over_50k_value,
-                            })
-                await asyncio.sleep(getattr(config, "DELAY_BETWEEN_REQUESTS", 1.5))
-
-            output = StringIO()
-            writer = csv.DictWriter(
-                output,
-                fieldnames=[
+        with profiling.job(f"{safe_filename(username)}_level2"):
+            try:
+                channels_l1 = await parser.get_similar_channels(username)
+                if not channels_l1:
+                    await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
+                    await context.bot.send_message(user_id, "На первом уровне похожих каналов не найдено.")
+                    return
+
+                ranker = Level2Ranker.from_config()
+                for line in channels_l1:
+                    uname = parse_username_from_line(line, config.LINE_FORMAT)
+                    if uname:
+                        channels_l2 = await parser.get_similar_channels(uname)
+                        with profiling.stage("parse"):
+                            parsed_l2 = [parse_line_to_dict(l2, config.LINE_FORMAT) for l2 in channels_l2]
+                        with profiling.stage("aggregate"):
+                            for parsed in parsed_l2:
+                                if parsed:
+                                    ranker.add(
+                                        uname,
+                                        parsed.get("username"),
+                                        parsed.get("participants_count"),
+                                        parsed.get("title"),
+                                    )
+                    with profiling.stage("delay"):
+                        await asyncio.sleep(getattr(config, "DELAY_BETWEEN_REQUESTS", 1.5))
+
+                with profiling.stage("rank"):
+                    ranked = ranker.ranked()
+
+                large_threshold = config.LARGE_CHANNEL_THRESHOLD
+                large_column = f"Подписчиков свыше {threshold_label(large_threshold)}"
+                fieldnames = [
                     "Исходный канал",
                     "Ссылка",
                     "Кол-во подписчиков",
                     "Название канала",
-                    "Подписчиков свыше 50k"
-                ],
-                delimiter=","
-            )
-            writer.writeheader()
-            for row in level2_data:
-                writer.writerow(row)
-            csv_bytes = BytesIO(output.getvalue().encode("utf-8"))
-            csv_bytes.name = f"{username}_level2_report.csv"
-            csv_bytes.seek(0)
-
-            await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=csv_bytes,
-                filename=csv_bytes.name,
-                caption="Готово! Вот ваш Level 2 отчёт.",
-            )
-        except Exception as exc:
-            await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
-            await context.bot.send_message(user_id, f"Ошибка при глубоком парсинге: {exc}")
+                    "Кол-во рекомендаций",
+                    large_column
+                ]
+                if ranker.near_duplicates:
+                    fieldnames += ["Кластер клонов", "Похожих каналов"]
+                output = StringIO()
+                writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=",")
+                writer.writeheader()
+                for row in ranked:
+                    subs_num = row["participants_count"]
+                    csv_row = {
+                        "Исходный канал": row["source"],
+                        "Ссылка": f"https://t.me/{row['username']}",
+                        "Кол-во подписчиков": subs_num,
+                        "Название канала": row["title"],
+                        "Кол-во рекомендаций": row["co_recommendations"],
+                        large_column: subs_num if subs_num > large_threshold else "",
+                    }
+                    if ranker.near_duplicates:
+                        csv_row["Кластер клонов"] = f"https://t.me/{row['cluster']}" if row["cluster"] else ""
+                        csv_row["Похожих каналов"] = row["near_duplicates"]
+                    writer.writerow(csv_row)
+                csv_bytes = BytesIO(output.getvalue().encode("utf-8"))
+                csv_bytes.name = f"{username}_level2_report.csv"
+                csv_bytes.seek(0)
+
+                await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
+                await context.bot.send_document(
+                    chat_id=user_id,
+                    document=csv_bytes,
+                    filename=csv_bytes.name,
+                    caption="Готово! Вот ваш Level 2 отчёт.",
+                )
+            except Exception as exc:
+                await context.bot.delete_message(chat_id=user_id, message_id=wait_msg_id)
+                await context.bot.send_message(user_id, f"Ошибка при глубоком парсинге: {exc}")
 
     asyncio.create_task(
         do_parsing_and_send(user_id, username, waiting_msg.message_id, context)
@@ -232,6 +250,21 @@ async def ask_channel_level2(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 def main():
     global parser
+    arg_parser = argparse.ArgumentParser(description="Telegram similar channel parser bot")
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write a per-stage timing report ({channel}_level*_profile.log) for every job",
+    )
+    arg_parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="like --profile, plus a cProfile dump ({channel}_level*_profile.prof)",
+    )
+    args = arg_parser.parse_args()
+    if args.profile or args.cprofile:
+        profiling.enable(cprofile=args.cprofile)
+
     parser = SimilarChannelParser()  # Создаём парсер только один раз
     app = ApplicationBuilder().token(config.BOT_TOKEN).build()
 
@@ -34,3 +34,62 @@ TELEGRAM_APP_VERSION = os.getenv("TELEGRAM_APP_VERSION", "4.16.8 arm64")
 
 # Если нужно добавить задержку между запросами (по умолчанию 1.5 секунды)
 DELAY_BETWEEN_REQUESTS = float(os.getenv("DELAY_BETWEEN_REQUESTS", "1.5"))
+
+# --- Режим обновления (python main.py --refresh) ---
+# Файл с временем последнего запроса и результатами по каждому каналу
+CRAWL_STATE_FILE = os.getenv("CRAWL_STATE_FILE", str(Path(SAVING_DIRECTORY) / "crawl_state.json"))
+# Каналы, запрошенные позже чем столько часов назад, берутся из кэша (по умолчанию неделя)
+REFRESH_MAX_AGE_HOURS = float(os.getenv("REFRESH_MAX_AGE_HOURS", "168"))
+# Максимум запросов Level 2 за один запуск обновления (0 — без ограничения)
+REFRESH_MAX_REQUESTS = int(os.getenv("REFRESH_MAX_REQUESTS", "0"))
+# Срок удваивается после каждого обновления без новых/пропавших рекомендаций,
+# не более чем столько раз (3 — до 8 недель для стабильных каналов, 0 — не удваивать)
+REFRESH_MAX_BACKOFF = int(os.getenv("REFRESH_MAX_BACKOFF", "3"))
+
+# --- Ранжирование Level 2 отчёта ---
+# Минимальное число подписчиков канала для попадания в отчёт
+MIN_PARTICIPANTS = int(os.getenv("MIN_PARTICIPANTS", "1000"))
+# Минимальное число разных каналов Level 1, рекомендовавших канал
+MIN_CO_RECOMMENDATIONS = int(os.getenv("MIN_CO_RECOMMENDATIONS", "1"))
+# Порог для колонки "Каналы >50k"
+LARGE_CHANNEL_THRESHOLD = int(os.getenv("LARGE_CHANNEL_THRESHOLD", "50000"))
+# Сортировка: co_recommendations, participants или weighted
+# (weighted = RANK_CO_WEIGHT * рекомендации + RANK_PARTICIPANTS_WEIGHT * log10(подписчики))
+RANK_BY = os.getenv("RANK_BY", "co_recommendations")
+RANK_CO_WEIGHT = float(os.getenv("RANK_CO_WEIGHT", "1.0"))
+RANK_PARTICIPANTS_WEIGHT = float(os.getenv("RANK_PARTICIPANTS_WEIGHT", "1.0"))
+# Сколько лучших каналов оставить в отчёте (0 — все)
+RANK_TOP_K = int(os.getenv("RANK_TOP_K", "0"))
+# Сколько каналов держать в памяти при подсчёте (0 — все, точные значения;
+# иначе приблизительный подсчёт Space-Saving, например 10 * RANK_TOP_K)
+RANK_MAX_TRACKED = int(os.getenv("RANK_MAX_TRACKED", "0"))
+
+# --- Профилирование (или флаги --profile / --cprofile) ---
+# Замер времени по этапам (сеть, flood wait, парсинг строк, тематика, запись файлов)
+PROFILE = os.getenv("PROFILE", "0").lower() in ("1", "true", "yes")
+# Дополнительно сохранять профиль cProfile ({канал}_profile.prof)
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "0").lower() in ("1", "true", "yes")
+
+# --- Сжатие файлов результатов ---
+# "" (без сжатия), "gzip" (.gz) или "zstd" (.zst, нужен пакет zstandard)
+OUTPUT_COMPRESSION = os.getenv("OUTPUT_COMPRESSION", "").lower()
+# Уровень сжатия (0 — по умолчанию: 6 для gzip, 3 для zstd)
+OUTPUT_COMPRESSION_LEVEL = int(os.getenv("OUTPUT_COMPRESSION_LEVEL", "0"))
+
+# --- Поиск почти одинаковых каналов (клонов/зеркал) по названию, нужен numpy ---
+# "" — выключено, "mark" — пометить кластеры в отчётах, "collapse" — оставить один канал на кластер
+NEAR_DUPLICATES = os.getenv("NEAR_DUPLICATES", "").lower()
+# Минимальная похожесть названий (оценка Жаккара по триграммам)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+# Параметры LSH: bands * rows = длина MinHash-подписи
+NEAR_DUPLICATE_BANDS = int(os.getenv("NEAR_DUPLICATE_BANDS", "16"))
+NEAR_DUPLICATE_ROWS = int(os.getenv("NEAR_DUPLICATE_ROWS", "4"))
+
+# --- Дополнительная информация о каналах (описание, привязанный чат) для определения тематики ---
+ENRICH = os.getenv("ENRICH", "0").lower() in ("1", "true", "yes")
+ENRICH_CACHE_FILE = os.getenv("ENRICH_CACHE_FILE", str(Path(SAVING_DIRECTORY) / "enrichment_cache.json"))
+# Одновременных запросов и размер пачки (между пачками — DELAY_BETWEEN_REQUESTS)
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "3"))
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "20"))
+# Через сколько дней запрашивать информацию заново (0 — никогда)
+ENRICH_MAX_AGE_DAYS = float(os.getenv("ENRICH_MAX_AGE_DAYS", "30"))
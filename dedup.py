@@ -0,0 +1,181 @@
+import re
+import unicodedata
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import config
+
+_NON_WORD = re.compile(r"[^\w\n]+|_+")
+
+# Odd 32-bit multipliers for hashing
+_SHINGLE_MULT = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D)
+_BAND_MULT = 0x100000001B3
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Near-duplicate detection requires numpy: python -m pip install numpy")
+
+
+def normalize_titles(titles: list[str | None]) -> list[str]:
+    """
+    Lowercases titles and drops emoji/punctuation so that
+    "🔥 Crypto NEWS!" and "crypto news" get the same signature.
+    All titles are normalized as one string, which is much faster than one by one.
+    """
+    if not titles:
+        return []
+    text = "\n".join((t or "").replace("\n", " ") for t in titles)
+    text = _NON_WORD.sub(" ", unicodedata.normalize("NFKC", text).casefold())
+    return [t.strip() for t in text.split("\n")]
+
+
+def _fmix32(h):
+    # murmur3 finalizer, spreads 3-gram codes over all 32 bits
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+
+def _shingle_hashes(titles: list[str]):
+    """
+    Character 3-gram hashes of all titles in one flat array, the offset
+    of every title's first shingle (for np.minimum.reduceat) and the number
+    of shingles per title. Titles are padded with spaces, so every non-empty
+    title has a shingle; empty titles have none.
+    """
+    padded = [f" {t} " for t in titles]
+    lengths = np.fromiter((len(t) for t in padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32)
+
+    starts = np.zeros(len(padded), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    counts = lengths - 2
+
+    # Shingle positions: 0..len-3 inside every title, never across titles
+    total = int(counts.sum())
+    shingle_offsets = np.zeros(len(padded), dtype=np.int64)
+    np.cumsum(counts[:-1], out=shingle_offsets[1:])
+    positions = np.arange(total, dtype=np.int64) + np.repeat(starts - shingle_offsets, counts)
+
+    with np.errstate(over="ignore"):
+        h = (
+            codes[positions] * np.uint32(_SHINGLE_MULT[0])
+            + codes[positions + 1] * np.uint32(_SHINGLE_MULT[1])
+            + codes[positions + 2] * np.uint32(_SHINGLE_MULT[2])
+        )
+        h = _fmix32(h)
+    return h, shingle_offsets, counts
+
+
+def minhash_signatures(titles: list[str], num_perm: int = 64, seed: int = 1, batch_size: int = 100_000):
+    """
+    MinHash signatures (len(titles) x num_perm, uint32) of normalized titles,
+    computed batch by batch over flat shingle arrays.
+    Empty titles have no shingles and get an all-0xFFFFFFFF signature.
+    """
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+    b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64).astype(np.uint32)
+
+    signatures = np.empty((len(titles), num_perm), dtype=np.uint32)
+    for batch_start in range(0, len(titles), batch_size):
+        batch = titles[batch_start:batch_start + batch_size]
+        hashes, offsets, counts = _shingle_hashes(batch)
+        out = signatures[batch_start:batch_start + len(batch)]
+        out.fill(np.iinfo(np.uint32).max)
+        # reduceat needs strictly valid offsets: a zero-shingle title at the end
+        # of a batch would point past the array, so empty titles are skipped
+        nonempty = counts > 0
+        if not nonempty.any():
+            continue
+        offsets = offsets[nonempty]
+        values = np.empty_like(hashes)
+        with np.errstate(over="ignore"):
+            for k in range(num_perm):
+                # Shingle hashes are already mixed, a*h + b mod 2**32 is enough as a permutation
+                np.multiply(hashes, a[k], out=values)
+                values += b[k]
+                out[nonempty, k] = np.minimum.reduceat(values, offsets)
+    return signatures
+
+
+def _connected_components(n: int, left, right):
+    """
+    Component label (smallest member index) of every node, by min-label propagation.
+    """
+    labels = np.arange(n, dtype=np.int64)
+    if len(left) == 0:
+        return labels
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, left, low)
+        np.minimum.at(new_labels, right, low)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def near_duplicate_clusters(
+    titles: list[str],
+    threshold: float | None = None,
+    bands: int | None = None,
+    rows: int | None = None,
+):
+    """
+    Groups titles that look alike (estimated Jaccard similarity of 3-gram sets
+    >= threshold) with MinHash + LSH banding, without pairwise comparison.
+    Returns a numpy array with the cluster label of every title: the index of
+    the cluster's first title. Empty titles are never clustered.
+    """
+    _require_numpy()
+    threshold = config.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+    bands = bands or config.NEAR_DUPLICATE_BANDS
+    rows = rows or config.NEAR_DUPLICATE_ROWS
+
+    normalized = normalize_titles(titles)
+    n = len(normalized)
+    if n < 2:
+        return np.arange(n, dtype=np.int64)
+    # Identical normalized titles (exact mirrors) are hashed once
+    unique_ids: dict[str, int] = {}
+    inverse = np.fromiter((unique_ids.setdefault(t, len(unique_ids)) for t in normalized), dtype=np.int64, count=n)
+    signatures = minhash_signatures(list(unique_ids), num_perm=bands * rows)[inverse]
+    valid = np.fromiter((bool(t) for t in normalized), dtype=bool, count=n)
+
+    left_parts, right_parts = [], []
+    with np.errstate(over="ignore"):
+        for band in range(bands):
+            band_sig = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+            keys = band_sig[:, 0].copy()
+            for j in range(1, rows):
+                keys = keys * np.uint64(_BAND_MULT) ^ band_sig[:, j]
+
+            order = np.argsort(keys)
+            sorted_keys = keys[order]
+            run_start = np.empty(n, dtype=bool)
+            run_start[0] = True
+            run_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+            # Link every bucket member to the first member of its bucket
+            first = order[np.maximum.accumulate(np.where(run_start, np.arange(n), 0))]
+            linked = ~run_start
+            members, heads = order[linked], first[linked]
+
+            # LSH gives candidates only: keep pairs whose signatures really agree
+            similar = (signatures[members] == signatures[heads]).mean(axis=1) >= threshold
+            keep = similar & valid[members] & valid[heads]
+            left_parts.append(members[keep])
+            right_parts.append(heads[keep])
+
+    left = np.concatenate(left_parts)
+    right = np.concatenate(right_parts)
+    return _connected_components(n, left, right)
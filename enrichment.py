@@ -0,0 +1,164 @@
+import asyncio
+import time
+from pathlib import Path
+
+from loguru import logger
+from telethon import TelegramClient, errors, functions
+
+import config
+from storage import channel_key, load_json, save_json
+
+# Errors that won't go away on retry: only these are cached as failed lookups.
+# ValueError/TypeError come from Telethon for unknown usernames/entities.
+PERMANENT_ERRORS = (
+    errors.ChannelPrivateError,
+    errors.ChannelInvalidError,
+    errors.ChannelPublicGroupNaError,
+    errors.UsernameNotOccupiedError,
+    errors.UsernameInvalidError,
+    ValueError,
+    TypeError,
+)
+
+
+class EnrichmentCache:
+    """
+    Persistent full channel info (description, linked chat) by username.
+    Permanently failed lookups are stored too, so private/deleted channels are not re-queried.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.channels: dict[str, dict] = {}
+        self.load()
+
+    def load(self):
+        self.channels = load_json(self.path, "enrichment cache")
+
+    def save(self):
+        save_json(self.path, self.channels, "enrichment cache")
+
+    def missing(self, usernames: list[str], max_age_days: float = 0) -> list[str]:
+        """
+        Usernames that were never enriched (or longer than max_age_days ago, if > 0), without duplicates.
+        """
+        now = time.time()
+        result = {}
+        for username in usernames:
+            info = self.channels.get(channel_key(username))
+            if info is None or (max_age_days > 0 and now - info.get("fetched_at", 0) >= max_age_days * 86400):
+                result.setdefault(channel_key(username), username)
+        return list(result.values())
+
+    def store(self, username: str, info: dict):
+        self.channels[channel_key(username)] = {**info, "fetched_at": time.time()}
+
+    def text(self, username: str) -> str:
+        """
+        Extra text for topic classification: description and linked chat title.
+        """
+        info = self.channels.get(channel_key(username)) or {}
+        return "\n".join(part for part in (info.get("about"), info.get("linked_chat_title")) if part)
+
+
+class RequestLimiter:
+    """
+    Shared pacing of concurrent workers: request starts are at least
+    `interval` seconds apart, and a flood wait pauses every worker, not
+    only the one that received it.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self.next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_at = loop.time() + self.interval
+
+    def pause(self, seconds: float):
+        self.next_at = max(self.next_at, asyncio.get_running_loop().time() + seconds)
+
+
+async def fetch_channel_info(client: TelegramClient, username: str, limiter: RequestLimiter) -> dict | None:
+    """
+    Description and linked discussion chat of one channel.
+    Returns {"error": ...} if the channel can't be accessed at all and None
+    on transient failures (flood wait after one retry, network/server errors),
+    so that the channel is retried next run.
+    """
+    for attempt in range(2):
+        await limiter.wait()
+        try:
+            full = await client(functions.channels.GetFullChannelRequest(channel=username))
+            break
+        except errors.FloodWaitError as e:
+            limiter.pause(e.seconds + 1)
+            if attempt:
+                logger.warning(f"Flood wait again for {username}, skipping it for now.")
+                return None
+            logger.warning(f"Flood wait while enriching {username}: all workers wait {e.seconds}s")
+        except PERMANENT_ERRORS as e:
+            logger.warning(f'Cannot fetch full info of "{username}": {type(e).__name__} - {e}')
+            return {"error": type(e).__name__}
+        except Exception as e:
+            logger.warning(f'Failed to fetch full info of "{username}", will retry next run: {type(e).__name__} - {e}')
+            return None
+
+    linked_chat_id = getattr(full.full_chat, "linked_chat_id", None)
+    linked_chat_title = ""
+    if linked_chat_id:
+        for chat in full.chats:
+            if chat.id == linked_chat_id:
+                linked_chat_title = getattr(chat, "title", "") or ""
+                break
+    return {
+        "about": getattr(full.full_chat, "about", "") or "",
+        "linked_chat_id": linked_chat_id,
+        "linked_chat_title": linked_chat_title,
+    }
+
+
+async def enrich_channels(
+    client: TelegramClient,
+    cache: EnrichmentCache,
+    usernames: list[str],
+    concurrency: int | None = None,
+    batch_size: int | None = None,
+    max_age_days: float | None = None,
+) -> int:
+    """
+    Fetches full info of channels missing from the cache: up to `concurrency`
+    requests in flight, started at least config.DELAY_BETWEEN_REQUESTS apart,
+    in batches of `batch_size`. The cache is saved after every batch, so an
+    interrupted run resumes where it stopped. Returns the number of channels fetched.
+    """
+    concurrency = concurrency or config.ENRICH_CONCURRENCY
+    batch_size = batch_size or config.ENRICH_BATCH_SIZE
+    max_age_days = config.ENRICH_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    todo = cache.missing(usernames, max_age_days)
+    if not todo:
+        logger.info(f"Enrichment: all {len(usernames)} channels are already cached.")
+        return 0
+    logger.info(f"Enrichment: fetching full info of {len(todo)}/{len(usernames)} channels…")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RequestLimiter(getattr(config, "DELAY_BETWEEN_REQUESTS", 1.5))
+
+    async def fetch(username: str):
+        async with semaphore:
+            info = await fetch_channel_info(client, username, limiter)
+        if info is not None:
+            cache.store(username, info)
+
+    for start in range(0, len(todo), batch_size):
+        await asyncio.gather(*(fetch(username) for username in todo[start:start + batch_size]))
+        cache.save()
+        logger.info(f"Enrichment: {min(start + batch_size, len(todo))}/{len(todo)} done.")
+    return len(todo)
@@ -4,12 +4,19 @@ import sys
 from pathlib import Path
 import re  # Added for parsing usernames
 import csv  # Added for CSV output
+import argparse
+from functools import lru_cache
 
 from loguru import logger
 from telethon import TelegramClient, functions, types
 from yarl import URL
 
 import config
+import profiling
+import storage
+from enrichment import EnrichmentCache, enrich_channels
+from ranking import Level2Ranker
+from refresh import CrawlState
 
 logger.remove()
 logger.add(
@@ -44,24 +51,26 @@ TOPIC_KEYWORDS = {
 }
 
 
-def get_channel_topic(title: str) -> str:
+def get_channel_topic(title: str, extra_text: str = "") -> str:
     """
     Determines channel topic based on keywords in the title.
+    If the title gives nothing, extra_text (description, linked chat title) is checked.
     """
-    if not title:
-        return "Не определена"
+    for text in (title, extra_text):
+        if not text:
+            continue
 
-    title_lower = title.lower()
-    for topic, keywords in TOPIC_KEYWORDS.items():
-        for keyword in keywords:
-            try:
-                # Use word boundaries to avoid partial matches
-                if re.search(r"\b" + re.escape(keyword) + r"\b", title_lower):
-                    return topic
-            except re.error:
-                # Fallback to simple substring check if regex fails
-                if keyword in title_lower:
-                    return topic
+        text_lower = text.lower()
+        for topic, keywords in TOPIC_KEYWORDS.items():
+            for keyword in keywords:
+                try:
+                    # Use word boundaries to avoid partial matches
+                    if re.search(r"\b" + re.escape(keyword) + r"\b", text_lower):
+                        return topic
+                except re.error:
+                    # Fallback to simple substring check if regex fails
+                    if keyword in text_lower:
+                        return topic
 
     return "Не определена"
 
@@ -69,9 +78,10 @@ def get_channel_topic(title: str) -> str:
 # --- Helper functions for parsing config.LINE_FORMAT lines ---
 
 
+@lru_cache(maxsize=None)
 def build_regex_pattern(format_string: str) -> str:
     """
-    Builds a regex pattern to parse lines based on the format string.
+    Builds a regex pattern to parse lines based on the format string (once per format).
     """
     # 1. Escape the format string so that delimiters are literal
     pattern_str = re.escape(format_string)
@@ -132,6 +142,22 @@ def parse_line_to_dict(line: str, format_string: str) -> dict | None:
         return None
 
 
+def safe_filename(channel_entity: str) -> str:
+    """
+    Turns a channel username or link into a file name prefix.
+    """
+    return channel_entity.lstrip("@").replace("/", "_").replace("\\", "_")
+
+
+def threshold_label(value: int) -> str:
+    """
+    Subscriber threshold for column headers: 50000 -> "50k", 1500 -> "1500".
+    """
+    if value >= 1000 and value % 1000 == 0:
+        return f"{value // 1000}k"
+    return str(value)
+
+
 # --- End of helper functions ---
 
 
@@ -209,7 +235,8 @@ class SimilarChannelParser:
         try:
             peer = channel_entity
             req = functions.channels.GetChannelRecommendationsRequest(channel=peer)
-            res: types.messages.Chats = await self.client(req)
+            with profiling.stage("network"):
+                res: types.messages.Chats = await self.client(req)
         except (ValueError, TypeError) as e:
             logger.error(f'Error fetching recommendations for "{channel_entity}": {e}')
             return []
@@ -218,7 +245,8 @@ class SimilarChannelParser:
             return []
         except types.errors.FloodWaitError as e:
             logger.warning(f"Flood wait for {channel_entity}: wait {e.seconds}s")
-            await asyncio.sleep(e.seconds + 1)
+            with profiling.stage("flood_wait"):
+                await asyncio.sleep(e.seconds + 1)
             return []
         except Exception as e:
             logger.error(f'Unexpected error fetching recommendations for "{channel_entity}": {type(e).__name__} - {e}')
@@ -258,12 +286,282 @@ class SimilarChannelParser:
         logger.success(log_text)
         return channels
 
-    async def main(self):
+    @staticmethod
+    def parse_lines(lines: list[str]) -> list[dict]:
+        """
+        Parses config.LINE_FORMAT lines into dicts, skipping (and logging) unparsable ones.
+        """
+        rows = []
+        with profiling.stage("parse"):
+            for line in lines:
+                row = parse_line_to_dict(line, config.LINE_FORMAT)
+                if row:
+                    rows.append(row)
+                else:
+                    logger.warning(f"Failed to parse line: '{line}'")
+        return rows
+
+    @staticmethod
+    def record_fetch(state: CrawlState, channel_entity: str, lines: list[str], rows: list[dict]) -> list[dict]:
+        """
+        Records a fresh fetch (raw lines and their parsed rows) in the crawl state
+        and returns its change-detection diff.
+        Empty results are not recorded: they are usually errors/flood waits,
+        not a channel that really lost all its recommendations.
+        """
+        if not lines:
+            return []
+        return state.record_fetch(channel_entity, lines, rows)
+
+    @staticmethod
+    def fallback_to_cache(state: CrawlState, channel_entity: str, lines: list[str], refresh: bool) -> list[str]:
+        """
+        In refresh mode an empty re-query (flood wait, transient error) keeps
+        the previous result instead of wiping the channel from the files.
+        """
+        if lines or not refresh:
+            return lines
+        cached = state.cached_lines(channel_entity)
+        if cached:
+            logger.warning(f"Re-query of {channel_entity} returned nothing, using {len(cached)} cached results.")
+        return cached
+
+    @staticmethod
+    def write_diff_report(diff_file: Path, diff_rows: list[dict]):
+        """
+        Writes channels added to / dropped from recommendations and subscriber deltas.
+        With no changes a header-only file is written, so a previous diff never looks current.
+        """
+        if not diff_rows:
+            logger.info("Refresh: no changes since the previous fetch.")
+        try:
+            with storage.open_output(diff_file, "utf-8-sig", newline="") as csvfile:
+                fieldnames = ["Исходный канал", "Изменение", "Канал", "Было", "Стало", "Разница"]
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer.writeheader()
+                for row in diff_rows:
+                    old_count, new_count = row["old_count"], row["new_count"]
+                    delta = new_count - old_count if row["change"] == "subscribers" else ""
+                    writer.writerow({
+                        "Исходный канал": row["source"],
+                        "Изменение": row["change"],
+                        "Канал": f"https://t.me/{row['username']}",
+                        "Было": old_count,
+                        "Стало": new_count,
+                        "Разница": delta,
+                    })
+            counts = {change: sum(r["change"] == change for r in diff_rows) for change in ("added", "dropped", "subscribers")}
+            logger.success(
+                f"Refresh diff written: {diff_file} (added {counts['added']}, dropped {counts['dropped']}, "
+                f"subscriber changes {counts['subscribers']})"
+            )
+        except Exception as e:
+            logger.error(f"Failed to write refresh diff {diff_file}: {e}")
+
+    async def parse_seed(
+        self,
+        channel_username_l0: str,
+        saving_dir_base: Path,
+        state: CrawlState,
+        refresh: bool = False,
+        enrichment_cache: EnrichmentCache | None = None,
+    ):
+        """
+        Level 1 and Level 2 parsing of one initial channel, writes its files to saving_dir_base.
+        With enrichment_cache, descriptions of the reported channels are fetched
+        (only those not cached yet) and used for topic classification.
+        """
+        logger.info(f"--- Level 1 Parsing for: {channel_username_l0} ---")
+        diff_rows = []
+        if refresh and not state.is_stale(
+            channel_username_l0, config.REFRESH_MAX_AGE_HOURS, config.REFRESH_MAX_BACKOFF
+        ):
+            channels_l1 = state.cached_lines(channel_username_l0)
+            logger.info(f"Level 1 for {channel_username_l0} is fresh, using {len(channels_l1)} cached results.")
+        else:
+            channels_l1 = await self.get_similar_channels(channel_username_l0)
+            rows_l1 = self.parse_lines(channels_l1)
+            with profiling.stage("state"):
+                diff_rows += self.record_fetch(state, channel_username_l0, channels_l1, rows_l1)
+                state.save()
+            channels_l1 = self.fallback_to_cache(state, channel_username_l0, channels_l1, refresh)
+
+        safe_filename_l0 = safe_filename(channel_username_l0)
+        saving_file_l1 = storage.output_path((saving_dir_base / f"{safe_filename_l0}_level1").with_suffix(".txt"))
+
+        if not channels_l1:
+            logger.warning(f"No Level 1 results for {channel_username_l0}. Skipping Level 2.")
+            with storage.open_output(saving_file_l1):
+                pass
+            logger.info(f"Created empty Level 1 file: {saving_file_l1}")
+            return
+
+        with profiling.stage("write"):
+            with storage.open_output(saving_file_l1) as file_l1:
+                file_l1.write("\n".join(channels_l1))
+        logger.success(f"Level 1: {len(channels_l1)} saved to {saving_file_l1}.")
+
+        # Level 2 parsing
+        logger.info(f"--- Level 2 Parsing for: {channel_username_l0} ---")
+        ranker = Level2Ranker.from_config()
+        usernames_l1 = []
+        with profiling.stage("parse"):
+            for line in channels_l1:
+                username = parse_username_from_line(line, config.LINE_FORMAT)
+                if username:
+                    usernames_l1.append(username)
+                else:
+                    logger.warning(f"Could not extract username from '{line}'")
+
+        if not usernames_l1:
+            logger.warning(f"No valid usernames for Level 2 from {channel_username_l0}.")
+            return
+
+        if refresh:
+            to_fetch = state.plan_refresh(
+                usernames_l1, config.REFRESH_MAX_AGE_HOURS, config.REFRESH_MAX_REQUESTS,
+                config.REFRESH_MAX_BACKOFF,
+            )
+            logger.info(
+                f"Refresh: re-querying {len(to_fetch)}/{len(usernames_l1)} stale channels, "
+                f"the rest come from cache."
+            )
+        else:
+            to_fetch = usernames_l1
+        fetch_set = set(to_fetch)
+        ordered_l1 = to_fetch + [u for u in usernames_l1 if u not in fetch_set]
+
+        parsed_l2_count = 0
+        total_l2_found = 0
+        for i, channel_username_l1 in enumerate(ordered_l1, 1):
+            peer_l1 = channel_username_l1 if channel_username_l1.startswith("@") else f"@{channel_username_l1}"
+            fetch = channel_username_l1 in fetch_set
+            logger.info(f"--- Level 2 ({i}/{len(ordered_l1)}): {peer_l1}{'' if fetch else ' (cached)'} ---")
+
+            if fetch:
+                channels_l2 = await self.get_similar_channels(peer_l1)
+                # Parsed once for both the crawl state and the ranker
+                parsed_l2 = self.parse_lines(channels_l2)
+                with profiling.stage("state"):
+                    diff_rows += self.record_fetch(state, channel_username_l1, channels_l2, parsed_l2)
+                    # Saved after every fetch: an interrupted crawl keeps what it already paid for
+                    state.save()
+                if not channels_l2:
+                    channels_l2 = self.fallback_to_cache(state, channel_username_l1, channels_l2, refresh)
+                    parsed_l2 = self.parse_lines(channels_l2)
+            else:
+                channels_l2 = state.cached_lines(channel_username_l1)
+                parsed_l2 = self.parse_lines(channels_l2)
+            parsed_l2_count += 1
+            total_l2_found += len(channels_l2)
+
+            if channels_l2:
+                with profiling.stage("aggregate"):
+                    for parsed_data in parsed_l2:
+                        ranker.add(
+                            channel_username_l1,
+                            parsed_data.get("username", "N/A"),
+                            parsed_data.get("participants_count", 0),
+                            parsed_data.get("title", "N/A"),
+                        )
+            else:
+                logger.info(f"No L2 results for {peer_l1}.")
+
+            if fetch:
+                delay = getattr(config, "DELAY_BETWEEN_REQUESTS", 1.5)
+                logger.debug(f"Waiting {delay}s before next L2 request…")
+                with profiling.stage("delay"):
+                    await asyncio.sleep(delay)
+
+        if refresh:
+            with profiling.stage("write"):
+                self.write_diff_report(
+                    storage.output_path(saving_dir_base / f"{safe_filename_l0}_refresh_diff.csv"), diff_rows
+                )
+
+        # Rank, filter & deduplicate and write CSV
+        if ranker.total:
+            with profiling.stage("rank"):
+                ranked = ranker.ranked()
+            logger.info(
+                f"Ranked {ranker.total} Level 2 entries by {ranker.rank_by}: kept {len(ranked)}, "
+                f"removed {ranker.filtered_out} (<{ranker.min_participants}), "
+                f"duplicates merged: {ranker.duplicates}, invalid: {ranker.invalid}"
+                + (f", evicted (RANK_MAX_TRACKED): {ranker.evicted}" if ranker.max_tracked else "")
+            )
+
+            if ranked:
+                csv_file = storage.output_path((saving_dir_base / f"{safe_filename_l0}_level2_report").with_suffix(".csv"))
+                logger.info(f"Writing {len(ranked)} to CSV: {csv_file}")
+                large_threshold = config.LARGE_CHANNEL_THRESHOLD
+                large_column = f"Каналы >{threshold_label(large_threshold)} (Ссылка)"
+                if enrichment_cache is not None:
+                    with profiling.stage("enrich"):
+                        await enrich_channels(self.client, enrichment_cache, [row["username"] for row in ranked])
+                with profiling.stage("topic"):
+                    topics = [
+                        get_channel_topic(row["title"], enrichment_cache.text(row["username"]) if enrichment_cache else "")
+                        for row in ranked
+                    ]
+                try:
+                    with profiling.stage("write"), storage.open_output(csv_file, "utf-8-sig", newline="") as csvfile:
+                        fieldnames = [
+                            "Исходный канал",
+                            "Ссылка",
+                            "Кол-во подписчиков",
+                            "Название канала",
+                            "Тематика",
+                            "Кол-во рекомендаций",
+                            "Оценка",
+                            large_column
+                        ]
+                        if ranker.near_duplicates:
+                            fieldnames += ["Кластер клонов", "Похожих каналов"]
+                        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                        writer.writeheader()
+                        for row, topic in zip(ranked, topics):
+                            uname = row["username"]
+                            title = row["title"]
+                            cnt = row["participants_count"]
+                            full_url = f"https://t.me/{uname}"
+                            over_threshold_url = full_url if cnt > large_threshold else ""
+                            csv_row = {
+                                "Исходный канал": row["source"],
+                                "Ссылка": full_url,
+                                "Кол-во подписчиков": cnt,
+                                "Название канала": title,
+                                "Тематика": topic,
+                                "Кол-во рекомендаций": row["co_recommendations"],
+                                "Оценка": round(row["score"], 3),
+                                large_column: over_threshold_url
+                            }
+                            if ranker.near_duplicates:
+                                csv_row["Кластер клонов"] = f"https://t.me/{row['cluster']}" if row["cluster"] else ""
+                                csv_row["Похожих каналов"] = row["near_duplicates"]
+                            writer.writerow(csv_row)
+                    logger.success(f"CSV written: {csv_file}")
+                except Exception as e:
+                    logger.error(f"Failed to write CSV {csv_file}: {e}")
+            else:
+                logger.warning(f"No unique Level 2 data for CSV for {channel_username_l0}.")
+        else:
+            logger.warning(f"No Level 2 data collected for {channel_username_l0}.")
+
+        logger.success(
+            f"--- Finished Level 2 for {channel_username_l0}: "
+            f"checked {parsed_l2_count} L1 channels, found {total_l2_found} total L2 channels (before filtering) ---"
+        )
+
+    async def main(self, refresh: bool = False):
         """
         Main function to handle CLI input (Level 1 and Level 2 parsing) if run standalone.
+        With refresh=True only stale channels (config.REFRESH_MAX_AGE_HOURS, longer
+        for channels that stopped changing) are re-queried and a diff against the previous fetch is written.
         """
         saving_dir_base = Path(config.SAVING_DIRECTORY)
         saving_dir_base.mkdir(exist_ok=True)
+        state = CrawlState(Path(config.CRAWL_STATE_FILE))
+        enrichment_cache = EnrichmentCache(Path(config.ENRICH_CACHE_FILE)) if config.ENRICH else None
 
         if not saving_dir_base.is_dir():
             logger.error(
@@ -286,138 +584,8 @@ class SimilarChannelParser:
                     logger.info("Exiting.")
                     break
 
-                logger.info(f"--- Level 1 Parsing for: {channel_username_l0} ---")
-                channels_l1 = await self.get_similar_channels(channel_username_l0)
-
-                safe_filename_l0 = channel_username_l0.lstrip("@").replace("/", "_").replace("\\", "_")
-                saving_file_l1 = (saving_dir_base / f"{safe_filename_l0}_level1").with_suffix(".txt")
-
-                if not channels_l1:
-                    logger.warning(f"No Level 1 results for {channel_username_l0}. Skipping Level 2.")
-                    saving_file_l1.write_text("", encoding="utf-8")
-                    logger.info(f"Created empty Level 1 file: {saving_file_l1}")
-                    continue
-
-                saving_file_l1.write_text("\n".join(channels_l1), encoding="utf-8")
-                logger.success(f"Level 1: {len(channels_l1)} saved to {saving_file_l1}.")
-
-                # Level 2 parsing
-                logger.info(f"--- Level 2 Parsing for: {channel_username_l0} ---")
-                level2_data_for_csv = []
-                usernames_l1 = []
-                for line in channels_l1:
-                    username = parse_username_from_line(line, config.LINE_FORMAT)
-                    if username:
-                        usernames_l1.append(username)
-                    else:
-                        logger.warning(f"Could not extract username from '{line}'")
-
-                if not usernames_l1:
-                    logger.warning(f"No valid usernames for Level 2 from {channel_username_l0}.")
-                    continue
-
-                parsed_l2_count = 0
-                total_l2_found = 0
-                for i, channel_username_l1 in enumerate(usernames_l1, 1):
-                    peer_l1 = channel_username_l1 if channel_username_l1.startswith("@") else f"@{channel_username_l1}"
-                    logger.info(f"--- Level 2 ({i}/{len(usernames_l1)}): {peer_l1} ---")
-
-                    channels_l2 = await self.get_similar_channels(peer_l1)
-                    parsed_l2_count += 1
-                    total_l2_found += len(channels_l2)
-
-                    if channels_l2:
-                        for line_l2 in channels_l2:
-                            parsed_data = parse_line_to_dict(line_l2, config.LINE_FORMAT)
-                            if parsed_data:
-                                level2_data_for_csv.append({
-                                    "source_l1": channel_username_l1,
-                                    "found_l2_username": parsed_data.get("username", "N/A"),
-                                    "found_l2_count": parsed_data.get("participants_count", 0),
-                                    "found_l2_title": parsed_data.get("title", "N/A")
-                                })
-                            else:
-                                logger.warning(f"Failed to parse L2 line: '{line_l2}'")
-                    else:
-                        logger.info(f"No L2 results for {peer_l1}.")
-
-                    delay = getattr(config, "DELAY_BETWEEN_REQUESTS", 1.5)
-                    logger.debug(f"Waiting {delay}s before next L2 request…")
-                    await asyncio.sleep(delay)
-
-                # Filter & deduplicate and write CSV
-                if level2_data_for_csv:
-                    unique_filtered = []
-                    seen_usernames = set()
-                    filtered_out = 0
-                    duplicates = 0
-
-                    logger.info(f"Filtering {len(level2_data_for_csv)} Level 2 entries…")
-                    for row in level2_data_for_csv:
-                        uname = row["found_l2_username"]
-                        cnt = row["found_l2_count"]
-
-                        # Only keep >= 1000 subscribers
-                        if cnt < 1000:
-                            filtered_out += 1
-                            continue
-
-                        if uname and uname != "N/A":
-                            if uname not in seen_usernames:
-                                unique_filtered.append(row)
-                                seen_usernames.add(uname)
-                            else:
-                                duplicates += 1
-                        else:
-                            logger.warning(f"Skipping invalid username in L2 data: {row}")
-
-                    logger.info(
-                        f"Filtered: kept {len(unique_filtered)}, removed {filtered_out} (<1k), "
-                        f"duplicates skipped: {duplicates}"
-                    )
-
-                    if unique_filtered:
-                        csv_file = (saving_dir_base / f"{safe_filename_l0}_level2_report").with_suffix(".csv")
-                        logger.info(f"Writing {len(unique_filtered)} to CSV: {csv_file}")
-                        try:
-                            with open(csv_file, "w", newline="", encoding="utf-8-sig") as csvfile:
-                                fieldnames = [
-                                    "Исходный канал",
-                                    "Ссылка",
-                                    "Кол-во подписчиков",
-                                    "Название канала",
-                                    "Тематика",
-                                    "Каналы >50k (Ссылка)"
-                                ]
-                                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                                writer.writeheader()
-                                for row in unique_filtered:
-                                    uname = row["found_l2_username"]
-                                    title = row["found_l2_title"]
-                                    cnt = row["found_l2_count"]
-                                    full_url = f"https://t.me/{uname}" if uname != "N/A" else ""
-                                    topic = get_channel_topic(title)
-                                    over_50k_url = full_url if cnt >= 50000 else ""
-                                    writer.writerow({
-                                        "Исходный канал": row["source_l1"],
-                                        "Ссылка": full_url,
-                                        "Кол-во подписчиков": cnt,
-                                        "Название канала": title,
-                                        "Тематика": topic,
-                                        "Каналы >50k (Ссылка)": over_50k_url
-                                    })
-                            logger.success(f"CSV written: {csv_file}")
-                        except Exception as e:
-                            logger.error(f"Failed to write CSV {csv_file}: {e}")
-                    else:
-                        logger.warning(f"No unique Level 2 data for CSV for {channel_username_l0}.")
-                else:
-                    logger.warning(f"No Level 2 data collected for {channel_username_l0}.")
-
-                logger.success(
-                    f"--- Finished Level 2 for {channel_username_l0}: "
-                    f"checked {parsed_l2_count} L1 channels, found {total_l2_found} total L2 channels (before filtering) ---"
-                )
+                with profiling.job(safe_filename(channel_username_l0), saving_dir_base):
+                    await self.parse_seed(channel_username_l0, saving_dir_base, state, refresh, enrichment_cache)
 
         except KeyboardInterrupt:
             logger.info("Interrupted by user.")
@@ -434,9 +602,31 @@ class SimilarChannelParser:
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Telegram similar channel parser")
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write a per-stage timing report ({channel}_profile.log) for every channel",
+    )
+    arg_parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="like --profile, plus a cProfile dump ({channel}_profile.prof)",
+    )
+    arg_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="re-query only stale channels and write a diff against the previous crawl",
+    )
+    args = arg_parser.parse_args()
+    if args.profile or args.cprofile:
+        profiling.enable(cprofile=args.cprofile)
+    # Before any request: a bad OUTPUT_COMPRESSION would otherwise fail after Level 1
+    storage.check_compression()
+
     parser = SimilarChannelParser()
     try:
-        asyncio.run(parser.main())
+        asyncio.run(parser.main(refresh=args.refresh))
     except Exception as e:
         logger.critical(f"Application failed: {e}")
         if hasattr(parser, "client") and parser.client.is_connected():
@@ -1,8 +1,67 @@
+import csv
 from pathlib import Path
 
-from config import LINE_FORMAT, SAVING_DIRECTORY
+import dedup
+import storage
+from ranking import NEAR_DUPLICATE_MODES
+from config import LINE_FORMAT, NEAR_DUPLICATES, SAVING_DIRECTORY
 
-WRITE_TO = Path(SAVING_DIRECTORY) / "ALL_MERGED.txt"
+WRITE_TO = storage.output_path(Path(SAVING_DIRECTORY) / "ALL_MERGED.txt")
+CLUSTERS_TO = storage.output_path(Path(SAVING_DIRECTORY) / "ALL_MERGED_near_duplicates.csv")
+
+
+def check_near_duplicates_mode(mode: str):
+    if mode not in NEAR_DUPLICATE_MODES:
+        raise ValueError(f"Unknown NEAR_DUPLICATES {mode!r}, expected one of: mark, collapse")
+
+
+def merge_near_duplicates(lines: list[str]) -> list[str]:
+    """
+    Clusters look-alike channels (clones, mirrors) by title and writes the
+    clusters to CLUSTERS_TO. With NEAR_DUPLICATES="collapse" only the largest
+    channel of every cluster is kept.
+    """
+    check_near_duplicates_mode(NEAR_DUPLICATES)
+    # Imported here: main pulls in Telethon and sets up logging, which a plain
+    # merge without NEAR_DUPLICATES doesn't need
+    from main import parse_line_to_dict
+
+    parsed = [parse_line_to_dict(line, LINE_FORMAT) for line in lines]
+    labels = dedup.near_duplicate_clusters([p["title"] if p else "" for p in parsed]).tolist()
+
+    clusters: dict[int, list[int]] = {}
+    for i, label in enumerate(labels):
+        clusters.setdefault(label, []).append(i)
+
+    def size_of(i: int) -> int:
+        return parsed[i]["participants_count"] if parsed[i] else 0
+
+    kept = []
+    clustered = 0
+    cluster_count = 0
+    with storage.open_output(CLUSTERS_TO, "utf-8-sig", newline="") as csvfile:
+        writer = csv.DictWriter(
+            csvfile, fieldnames=["Кластер", "Ссылка", "Кол-во подписчиков", "Название канала"]
+        )
+        writer.writeheader()
+        for members in clusters.values():
+            members.sort(key=size_of, reverse=True)
+            kept.append(lines[members[0]])
+            if len(members) < 2:
+                continue
+            clustered += len(members)
+            cluster_count += 1
+            head = parsed[members[0]]["username"]
+            for i in members:
+                writer.writerow({
+                    "Кластер": f"https://t.me/{head}",
+                    "Ссылка": f"https://t.me/{parsed[i]['username']}",
+                    "Кол-во подписчиков": parsed[i]["participants_count"],
+                    "Название канала": parsed[i]["title"],
+                })
+
+    print(f'{clustered} look-alike channels in {cluster_count} clusters written to "{CLUSTERS_TO}"')
+    return kept if NEAR_DUPLICATES == "collapse" else lines
 
 
 def main():
@@ -11,24 +70,30 @@ def main():
     #         'For correct work of this module the LINE_FORMAT should start with "{username}:"'
     #     )
 
+    # Fail before reading anything if the mode is misspelled
+    check_near_duplicates_mode(NEAR_DUPLICATES)
     saved_channels_dir = Path(SAVING_DIRECTORY).absolute()
     if not saved_channels_dir.is_dir():
         raise ValueError(f"Directory not exists {SAVING_DIRECTORY}")
-    channel_files = [p for p in saved_channels_dir.iterdir() if p.suffix == ".txt"]
+    # Plain and compressed (.txt.gz / .txt.zst) files are read the same way, line by line
+    channel_files = [p for p in saved_channels_dir.iterdir() if storage.logical_suffix(p) == ".txt"]
 
     all_channels = set()
     for file in channel_files:
-        text = file.read_text(encoding="utf-8")
-        channels = text.split("\n")
-        for channel in channels:
+        for channel in storage.iter_lines(file):
             channel = channel.strip()
             if channel:
                 # username = channel.split(":")[0].lower()
                 all_channels.add(channel)
 
-    WRITE_TO.write_text("\n".join(all_channels), encoding="utf-8")
+    merged_channels = list(all_channels)
+    if NEAR_DUPLICATES:
+        merged_channels = merge_near_duplicates(merged_channels)
+
+    with storage.open_output(WRITE_TO) as merged:
+        merged.write("\n".join(merged_channels))
 
-    print(f'{len(all_channels)} merged and written to "{WRITE_TO}"')
+    print(f'{len(merged_channels)} merged and written to "{WRITE_TO}"')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+from loguru import logger
+
+import config
+
+# Enabled by PROFILE=1 / PROFILE_CPROFILE=1 in .env or by --profile / --cprofile
+enabled = config.PROFILE or config.PROFILE_CPROFILE
+cprofile_enabled = config.PROFILE_CPROFILE
+
+# Profile of the job running in the current asyncio task (each bot job gets its own)
+_current: ContextVar["JobProfile | None"] = ContextVar("current_job_profile", default=None)
+_cprofile_active = False
+_NULL_STAGE = nullcontext()
+
+
+def enable(cprofile: bool = False):
+    global enabled, cprofile_enabled
+    enabled = True
+    cprofile_enabled = cprofile_enabled or cprofile
+
+
+class JobProfile:
+    """
+    Wall-clock time spent in each named stage of one crawl job.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: dict[str, list[float]] = {}
+        self.started_at = time.perf_counter()
+        self.finished_at: float | None = None
+        self.cprofile: cProfile.Profile | None = None
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += time.perf_counter() - start
+            totals[1] += 1
+
+    def report(self, with_cprofile: bool = True) -> str:
+        wall = (self.finished_at or time.perf_counter()) - self.started_at
+        lines = [
+            f"Profile of {self.name}: {wall:.3f}s wall time",
+            f"{'stage':<12} {'total, s':>10} {'calls':>8} {'avg, ms':>10} {'share':>7}",
+        ]
+        accounted = 0.0
+        for name, (total, calls) in sorted(self.stages.items(), key=lambda item: item[1][0], reverse=True):
+            accounted += total
+            share = total / wall * 100 if wall else 0.0
+            lines.append(f"{name:<12} {total:>10.3f} {calls:>8} {total / calls * 1000:>10.2f} {share:>6.1f}%")
+        other = max(wall - accounted, 0.0)
+        share = other / wall * 100 if wall else 0.0
+        lines.append(f"{'other':<12} {other:>10.3f} {'':>8} {'':>10} {share:>6.1f}%")
+
+        if with_cprofile and self.cprofile is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.cprofile, stream=stream).sort_stats("cumulative").print_stats(30)
+            lines += ["", stream.getvalue()]
+        return "\n".join(lines)
+
+    def write_report(self, directory: Path):
+        # .log, not .txt: merge_parsed.py treats every .txt in SAVING_DIRECTORY as channels
+        report_file = Path(directory) / f"{self.name}_profile.log"
+        try:
+            report_file.parent.mkdir(parents=True, exist_ok=True)
+            report_file.write_text(self.report(), encoding="utf-8")
+            if self.cprofile is not None:
+                self.cprofile.dump_stats(report_file.with_suffix(".prof"))
+            logger.info(f"Profile written: {report_file}")
+        except OSError as e:
+            logger.error(f"Failed to write profile {report_file}: {e}")
+
+
+@contextmanager
+def job(name: str, directory: Path | str | None = None):
+    """
+    Profiles one crawl job when profiling is enabled and writes
+    {name}_profile.log (and {name}_profile.prof with cProfile) at the end.
+    """
+    global _cprofile_active
+    if not enabled:
+        yield None
+        return
+
+    profile = JobProfile(name)
+    token = _current.set(profile)
+    # Only one cProfile can run at a time; concurrent bot jobs get timers only
+    if cprofile_enabled and not _cprofile_active:
+        profile.cprofile = cProfile.Profile()
+        _cprofile_active = True
+        profile.cprofile.enable()
+    try:
+        yield profile
+    finally:
+        if profile.cprofile is not None:
+            profile.cprofile.disable()
+            _cprofile_active = False
+        profile.finished_at = time.perf_counter()
+        _current.reset(token)
+        logger.info("\n" + profile.report(with_cprofile=False))
+        profile.write_report(Path(directory or config.SAVING_DIRECTORY))
+
+
+def stage(name: str):
+    """
+    Times a stage of the current job; a no-op when no job is being profiled.
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NULL_STAGE
+    return profile.stage(name)
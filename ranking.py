@@ -0,0 +1,188 @@
+import heapq
+import math
+
+import config
+import dedup
+
+RANK_MODES = ("co_recommendations", "participants", "weighted")
+NEAR_DUPLICATE_MODES = ("", "mark", "collapse")
+
+
+class Level2Ranker:
+    """
+    Streaming aggregation of Level 2 results: one record per channel with its
+    distinct recommending sources, top_k selected with a heap in `ranked()`.
+    max_tracked > 0 bounds memory (Space-Saving, counts may be overestimated);
+    near_duplicates="mark"/"collapse" clusters look-alike channels by title.
+    """
+
+    def __init__(
+        self,
+        rank_by: str = "co_recommendations",
+        top_k: int = 0,
+        min_participants: int = 1000,
+        min_co_recommendations: int = 1,
+        co_weight: float = 1.0,
+        participants_weight: float = 1.0,
+        near_duplicates: str = "",
+        max_tracked: int = 0,
+    ):
+        if rank_by not in RANK_MODES:
+            raise ValueError(f"Unknown rank mode {rank_by!r}, expected one of {', '.join(RANK_MODES)}")
+        if near_duplicates not in NEAR_DUPLICATE_MODES:
+            raise ValueError(
+                f"Unknown near-duplicate mode {near_duplicates!r}, expected one of: mark, collapse"
+            )
+        if near_duplicates:
+            # Fail before the crawl, not in ranked() after all Level 2 requests
+            dedup._require_numpy()
+        self.rank_by = rank_by
+        self.top_k = top_k
+        self.min_participants = min_participants
+        self.min_co_recommendations = min_co_recommendations
+        self.co_weight = co_weight
+        self.participants_weight = participants_weight
+        self.near_duplicates = near_duplicates
+        self.max_tracked = max_tracked
+
+        self.channels: dict[str, dict] = {}
+        # Lazy min-heap of (score, participants, key) for eviction; only used with max_tracked
+        self._heap: list[tuple] = []
+        self.evicted = 0
+        self._source_ids: dict[str, int] = {}
+        self.total = 0
+        self.filtered_out = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    @classmethod
+    def from_config(cls) -> "Level2Ranker":
+        return cls(
+            rank_by=config.RANK_BY,
+            top_k=config.RANK_TOP_K,
+            min_participants=config.MIN_PARTICIPANTS,
+            min_co_recommendations=config.MIN_CO_RECOMMENDATIONS,
+            co_weight=config.RANK_CO_WEIGHT,
+            participants_weight=config.RANK_PARTICIPANTS_WEIGHT,
+            near_duplicates=config.NEAR_DUPLICATES,
+            max_tracked=config.RANK_MAX_TRACKED,
+        )
+
+    def add(self, source: str, username: str | None, participants_count: int, title: str) -> bool:
+        """
+        Adds one Level 2 result recommended by `source`.
+        Returns False if the row was filtered out or invalid.
+        """
+        self.total += 1
+        if not username or username == "N/A":
+            self.invalid += 1
+            return False
+        if participants_count < self.min_participants:
+            self.filtered_out += 1
+            return False
+
+        source_id = self._source_ids.setdefault(source.lstrip("@").lower(), len(self._source_ids))
+        key = username.lower()
+        channel = self.channels.get(key)
+        if channel is None:
+            inherited = 0
+            if self.max_tracked > 0 and len(self.channels) >= self.max_tracked:
+                inherited = self._evict()
+            channel = self.channels[key] = {
+                "source": source,
+                "username": username,
+                "participants_count": participants_count,
+                "title": title,
+                "sources": {source_id},
+                "inherited": inherited,
+            }
+        else:
+            self.duplicates += 1
+            channel["participants_count"] = participants_count
+            channel["sources"].add(source_id)
+
+        if self.max_tracked > 0:
+            heapq.heappush(self._heap, (self.score(channel), participants_count, key))
+            if len(self._heap) > 4 * self.max_tracked:
+                self._heap = [(self.score(c), c["participants_count"], k) for k, c in self.channels.items()]
+                heapq.heapify(self._heap)
+        return True
+
+    def _evict(self) -> int:
+        """
+        Drops the lowest-scored tracked channel, returns the co-recommendation
+        count the newcomer inherits (0 when ranking by subscribers only).
+        """
+        while self._heap:
+            score, participants_count, key = heapq.heappop(self._heap)
+            channel = self.channels.get(key)
+            # Stale entry: the channel was evicted or its score changed since
+            if channel is None or (self.score(channel), channel["participants_count"]) != (score, participants_count):
+                continue
+            del self.channels[key]
+            self.evicted += 1
+            if self.rank_by == "participants":
+                return 0
+            return self.co_recommendations(channel)
+        return 0
+
+    @staticmethod
+    def co_recommendations(channel: dict) -> int:
+        return len(channel["sources"]) + channel["inherited"]
+
+    def score(self, channel: dict) -> float:
+        co_recommendations = self.co_recommendations(channel)
+        if self.rank_by == "co_recommendations":
+            return co_recommendations
+        if self.rank_by == "participants":
+            return channel["participants_count"]
+        return (
+            self.co_weight * co_recommendations
+            + self.participants_weight * math.log10(channel["participants_count"] + 1)
+        )
+
+    def ranked(self) -> list[dict]:
+        """
+        Returns the top channels by score (all of them if top_k <= 0), best first.
+        Ties are broken by subscriber count. Rows have "cluster" (the best channel
+        of its look-alike cluster, empty if it has none) and "near_duplicates"
+        (number of other channels in the cluster).
+        """
+        keyed = [
+            (self.score(c), c["participants_count"], c) for c in self.channels.values()
+            if self.co_recommendations(c) >= self.min_co_recommendations
+        ]
+
+        clusters: dict[int, tuple] = {}
+        if self.near_duplicates and keyed:
+            labels = dedup.near_duplicate_clusters([c["title"] for _, _, c in keyed]).tolist()
+            cluster_best: dict[int, tuple] = {}
+            cluster_size: dict[int, int] = {}
+            for label, item in zip(labels, keyed):
+                cluster_size[label] = cluster_size.get(label, 0) + 1
+                if label not in cluster_best or item[:2] > cluster_best[label][:2]:
+                    cluster_best[label] = item
+            for label, item in zip(labels, keyed):
+                clusters[id(item[2])] = (cluster_best[label][2]["username"], cluster_size[label])
+            if self.near_duplicates == "collapse":
+                keyed = list(cluster_best.values())
+
+        if self.top_k > 0:
+            best = heapq.nlargest(self.top_k, keyed, key=lambda item: item[:2])
+        else:
+            best = sorted(keyed, key=lambda item: item[:2], reverse=True)
+
+        rows = []
+        for score, _, c in best:
+            cluster, size = clusters.get(id(c), ("", 1))
+            rows.append({
+                "source": c["source"],
+                "username": c["username"],
+                "participants_count": c["participants_count"],
+                "title": c["title"],
+                "co_recommendations": self.co_recommendations(c),
+                "score": score,
+                "cluster": cluster if size > 1 else "",
+                "near_duplicates": size - 1,
+            })
+        return rows
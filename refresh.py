@@ -0,0 +1,156 @@
+import time
+from pathlib import Path
+
+from storage import channel_key, load_json, save_json
+
+STATE_VERSION = 1
+
+
+class CrawlState:
+    """
+    Persistent record of the last fetch of every crawled channel.
+
+    "sources" holds the recommendation lines each channel returned last time
+    (used to skip fresh channels in refresh mode), "channels" holds the last two
+    observed subscriber counts of every channel seen in recommendations
+    (used for subscriber deltas and for prioritizing fast-growing channels).
+    Sources whose recommendations didn't change are re-queried less and less often.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.sources: dict[str, dict] = {}
+        self.channels: dict[str, dict] = {}
+        self.load()
+
+    def load(self):
+        data = load_json(self.path, "crawl state")
+        self.sources = data.get("sources", {})
+        self.channels = data.get("channels", {})
+
+    def save(self):
+        data = {"version": STATE_VERSION, "sources": self.sources, "channels": self.channels}
+        save_json(self.path, data, "crawl state")
+
+    def age(self, username: str, now: float | None = None) -> float | None:
+        """
+        Seconds since the channel was last fetched, None if it never was.
+        """
+        source = self.sources.get(channel_key(username))
+        if not source:
+            return None
+        return (now or time.time()) - source.get("fetched_at", 0)
+
+    def max_age_hours(self, username: str, base_hours: float, max_backoff: int = 0) -> float:
+        """
+        Refresh interval of one channel: base_hours doubled for every previous
+        re-query that found no added/dropped recommendations, at most max_backoff times.
+        """
+        source = self.sources.get(channel_key(username)) or {}
+        return base_hours * 2 ** min(source.get("unchanged", 0), max(max_backoff, 0))
+
+    def is_stale(self, username: str, max_age_hours: float, max_backoff: int = 0) -> bool:
+        age = self.age(username)
+        return age is None or age >= self.max_age_hours(username, max_age_hours, max_backoff) * 3600
+
+    def cached_lines(self, username: str) -> list[str]:
+        source = self.sources.get(channel_key(username))
+        return list(source.get("lines", [])) if source else []
+
+    def growth_rate(self, username: str) -> float:
+        """
+        Relative subscriber growth per day between the last two observations.
+        """
+        channel = self.channels.get(channel_key(username))
+        if not channel or "prev_count" not in channel:
+            return 0.0
+        days = max((channel["count_at"] - channel["prev_count_at"]) / 86400, 1 / 24)
+        return (channel["count"] - channel["prev_count"]) / max(channel["prev_count"], 1) / days
+
+    def plan_refresh(
+        self, usernames: list[str], max_age_hours: float, max_requests: int = 0, max_backoff: int = 0
+    ) -> list[str]:
+        """
+        Returns the stale channels to re-query, most likely to have changed first:
+        never fetched channels, then by growth rate, then by age.
+        If max_requests > 0 the plan is truncated to that many channels.
+        """
+        now = time.time()
+        stale = [u for u in usernames if self.is_stale(u, max_age_hours, max_backoff)]
+
+        def priority(username: str):
+            age = self.age(username, now)
+            if age is None:
+                return (1, 0.0, 0.0)
+            return (0, abs(self.growth_rate(username)), age)
+
+        stale.sort(key=priority, reverse=True)
+        if max_requests > 0:
+            stale = stale[:max_requests]
+        return stale
+
+    def record_fetch(self, username: str, lines: list[str], rows: list[dict]) -> list[dict]:
+        """
+        Stores a fresh fetch of `username` (raw lines and their parsed rows)
+        and returns the diff against the previous fetch:
+        channels added to / dropped from recommendations and subscriber deltas.
+        """
+        now = time.time()
+        key = channel_key(username)
+        previous = self.sources.get(key)
+        # key -> username as Telegram returned it (older states stored keys only)
+        old_usernames = {channel_key(u): u for u in previous.get("usernames", [])} if previous else None
+
+        diff = []
+        new_usernames = []
+        for row in rows:
+            uname = row.get("username")
+            if not uname:
+                continue
+            ukey = channel_key(uname)
+            new_usernames.append(uname)
+            count = row.get("participants_count", 0)
+
+            channel = self.channels.get(ukey)
+            if channel is None:
+                self.channels[ukey] = {"count": count, "count_at": now}
+            elif channel["count"] != count:
+                diff.append({
+                    "source": username,
+                    "change": "subscribers",
+                    "username": uname,
+                    "old_count": channel["count"],
+                    "new_count": count,
+                })
+                channel["prev_count"] = channel["count"]
+                channel["prev_count_at"] = channel["count_at"]
+                channel["count"] = count
+                channel["count_at"] = now
+
+            if old_usernames is not None and ukey not in old_usernames:
+                diff.append({
+                    "source": username,
+                    "change": "added",
+                    "username": uname,
+                    "old_count": "",
+                    "new_count": count,
+                })
+
+        if old_usernames is not None:
+            new_keys = {channel_key(u) for u in new_usernames}
+            for ukey in sorted(old_usernames.keys() - new_keys):
+                channel = self.channels.get(ukey, {})
+                diff.append({
+                    "source": username,
+                    "change": "dropped",
+                    "username": old_usernames[ukey],
+                    "old_count": channel.get("count", ""),
+                    "new_count": "",
+                })
+
+        changed = any(row["change"] != "subscribers" for row in diff)
+        unchanged = previous.get("unchanged", 0) + 1 if previous and not changed else 0
+        self.sources[key] = {
+            "fetched_at": now, "lines": list(lines), "usernames": new_usernames, "unchanged": unchanged,
+        }
+        return diff
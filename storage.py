@@ -0,0 +1,150 @@
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import IO, Iterator
+
+from loguru import logger
+
+import config
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def _zstd():
+    """
+    zstd support: `zstandard` package or the standard library (Python 3.14+).
+    """
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        pass
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        raise RuntimeError(
+            'OUTPUT_COMPRESSION="zstd" requires the zstandard package: python -m pip install zstandard'
+        ) from None
+
+
+def compression_of(path: Path) -> str | None:
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.suffix == suffix:
+            return compression
+    return None
+
+
+def check_compression(compression: str | None = None):
+    """
+    Raises if OUTPUT_COMPRESSION is unknown or its library is missing.
+    Called at startup, so that a typo doesn't fail the crawl after the first requests.
+    """
+    compression = config.OUTPUT_COMPRESSION if compression is None else compression
+    if not compression:
+        return
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(
+            f"Unknown OUTPUT_COMPRESSION {compression!r}, expected one of {', '.join(COMPRESSION_SUFFIXES)}"
+        )
+    if compression == "zstd":
+        _zstd()
+
+
+def output_path(path: Path, compression: str | None = None) -> Path:
+    """
+    Path the file is written to: `path` with .gz/.zst appended when compression is on.
+    """
+    compression = config.OUTPUT_COMPRESSION if compression is None else compression
+    if not compression:
+        return path
+    if compression not in COMPRESSION_SUFFIXES:
+        check_compression(compression)  # raises ValueError
+    return path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+
+
+def _open(path: Path, mode: str, encoding: str, newline: str | None) -> IO[str]:
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding, newline=newline)
+    level = config.OUTPUT_COMPRESSION_LEVEL or DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        if "w" in mode:
+            return gzip.open(path, mode + "t", compresslevel=level, encoding=encoding, newline=newline)
+        return gzip.open(path, mode + "t", encoding=encoding, newline=newline)
+    zstd = _zstd()
+    if "w" in mode:
+        if zstd.__name__ == "zstandard":
+            compressor = zstd.ZstdCompressor(level=level)
+            return zstd.open(path, mode + "t", cctx=compressor, encoding=encoding, newline=newline)
+        return zstd.open(path, mode + "t", level=level, encoding=encoding, newline=newline)
+    return zstd.open(path, mode + "t", encoding=encoding, newline=newline)
+
+
+def open_output(path: Path, encoding: str = "utf-8", newline: str | None = None) -> IO[str]:
+    """
+    Opens `path` for streaming text writes, compressed if it ends with .gz/.zst.
+    Use `output_path()` to get the name according to config.OUTPUT_COMPRESSION.
+    """
+    return _open(Path(path), "w", encoding, newline)
+
+
+def open_input(path: Path, encoding: str = "utf-8", newline: str | None = None) -> IO[str]:
+    """
+    Opens a plain, .gz or .zst file for streaming text reads.
+    """
+    return _open(Path(path), "r", encoding, newline)
+
+
+def logical_suffix(path: Path) -> str:
+    """
+    Suffix ignoring compression: "channels.txt.gz" -> ".txt".
+    """
+    if compression_of(path):
+        return Path(path.stem).suffix
+    return path.suffix
+
+
+def channel_key(username: str) -> str:
+    """
+    Key of a channel in the JSON caches: "@Name " -> "name".
+    """
+    return username.strip().lstrip("@").lower()
+
+
+def load_json(path: Path, what: str) -> dict:
+    """
+    Reads a JSON cache, {} if it doesn't exist or is broken.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read {what} {path}: {e}. Starting from scratch.")
+        return {}
+
+
+def save_json(path: Path, data: dict, what: str):
+    """
+    Writes a JSON cache atomically (temp file + rename), so an interrupted run never leaves it half-written.
+    """
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    try:
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Failed to save {what} {path}: {e}")
+
+
+def iter_lines(path: Path, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Streams the lines of a plain or compressed text file without trailing newlines.
+    """
+    with open_input(path, encoding=encoding) as file:
+        for line in file:
+            yield line.rstrip("\r\n")
@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import dedup
+from ranking import Level2Ranker
+
+
+def test_clusters_look_alike_titles():
+    labels = dedup.near_duplicate_clusters(["🔥 Crypto NEWS!", "crypto news", "Cats and dogs"])
+    assert labels[0] == labels[1]
+    assert labels[2] != labels[0]
+
+
+@pytest.mark.parametrize("empty_title", ["", "🔥🔥🔥", "...", None])
+def test_empty_title_at_end_of_batch(empty_title):
+    labels = dedup.near_duplicate_clusters(["Crypto news", "crypto news!", empty_title])
+    assert labels.tolist() == [0, 0, 2]
+
+
+def test_empty_titles_are_never_clustered():
+    labels = dedup.near_duplicate_clusters(["🔥🔥🔥", "...", "", "Crypto news"])
+    assert labels.tolist() == [0, 1, 2, 3]
+
+
+def test_signatures_with_only_empty_titles():
+    signatures = dedup.minhash_signatures(["", ""], num_perm=8)
+    assert (signatures == np.iinfo(np.uint32).max).all()
+
+
+def test_empty_title_in_middle_of_batches():
+    titles = ["Crypto news", "🔥🔥🔥", "crypto news!", ""]
+    signatures = dedup.minhash_signatures(dedup.normalize_titles(titles), num_perm=8, batch_size=2)
+    assert (signatures[0] == signatures[2]).all()
+    assert (signatures[1] == np.iinfo(np.uint32).max).all()
+
+
+def test_ranker_collapse_with_emoji_title():
+    ranker = Level2Ranker(near_duplicates="collapse")
+    ranker.add("a", "news1", 5000, "Crypto News")
+    ranker.add("b", "news2", 9000, "🔥CRYPTO news")
+    ranker.add("c", "fire", 2000, "🔥🔥🔥")
+    rows = ranker.ranked()
+    assert [row["username"] for row in rows] == ["news2", "fire"]
+    assert rows[0]["near_duplicates"] == 1
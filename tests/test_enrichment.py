@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from telethon import errors
+
+import enrichment
+
+
+def _full(about):
+    return SimpleNamespace(
+        full_chat=SimpleNamespace(about=about, linked_chat_id=5),
+        chats=[SimpleNamespace(id=5, title="Discussion")],
+    )
+
+
+def _run(client, cache, usernames):
+    return asyncio.run(enrichment.enrich_channels(client, cache, usernames, concurrency=2, batch_size=2))
+
+
+def test_transient_errors_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrichment.config, "DELAY_BETWEEN_REQUESTS", 0)
+    failures = {"private": errors.ChannelPrivateError(None), "unknown": ValueError("no such user"),
+                "offline": ConnectionError("network down")}
+
+    async def client(request):
+        username = request.channel
+        if username in failures:
+            raise failures[username]
+        return _full(f"about {username}")
+
+    monkeypatch.setattr(enrichment.functions.channels, "GetFullChannelRequest", lambda channel: SimpleNamespace(channel=channel))
+    cache = enrichment.EnrichmentCache(tmp_path / "cache.json")
+    _run(client, cache, ["ok", "private", "unknown", "offline"])
+
+    assert cache.text("ok") == "about ok\nDiscussion"
+    assert cache.channels["private"]["error"] == "ChannelPrivateError"
+    assert cache.channels["unknown"]["error"] == "ValueError"
+    assert enrichment.EnrichmentCache(tmp_path / "cache.json").missing(["ok", "private", "unknown", "offline"]) == ["offline"]
+
+
+def test_flood_wait_pauses_all_workers_and_requests_are_spaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrichment.config, "DELAY_BETWEEN_REQUESTS", 0.01)
+    monkeypatch.setattr(enrichment.functions.channels, "GetFullChannelRequest", lambda channel: SimpleNamespace(channel=channel))
+    started = []
+    flooded = []
+
+    async def client(request):
+        now = asyncio.get_running_loop().time()
+        started.append(now)
+        if request.channel == "a" and not flooded:
+            flooded.append(now)
+            error = errors.FloodWaitError(None)
+            error.seconds = 0
+            raise error
+        return _full("")
+
+    cache = enrichment.EnrichmentCache(tmp_path / "cache.json")
+    asyncio.run(enrichment.enrich_channels(client, cache, ["a", "b", "c", "d"], concurrency=4, batch_size=4))
+
+    assert len(started) == 5
+    gaps = [later - earlier for earlier, later in zip(started, started[1:])]
+    assert all(gap >= 0.009 for gap in gaps)
+    # FloodWaitError(seconds=0) still pauses everyone for the extra second
+    assert all(t - flooded[0] >= 0.99 for t in started if t > flooded[0])
+    assert set(cache.channels) == {"a", "b", "c", "d"}
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import dedup
+from ranking import Level2Ranker
+
+
+def _feed(ranker, rows):
+    for source, username, participants_count in rows:
+        ranker.add(source, username, participants_count, username)
+
+
+def test_counts_distinct_sources_and_filters():
+    ranker = Level2Ranker(top_k=2)
+    _feed(ranker, [
+        ("a", "x", 5000), ("b", "x", 5100), ("a", "small", 900),
+        ("c", "z", 100000), ("a", "w", 2000), ("b", "w", 2000), ("c", "w", 2000),
+    ])
+    rows = ranker.ranked()
+    assert [(r["username"], r["co_recommendations"]) for r in rows] == [("w", 3), ("x", 2)]
+    assert ranker.filtered_out == 1
+
+
+def test_max_tracked_bounds_memory_and_keeps_heavy_hitters():
+    random.seed(1)
+    rows = []
+    for source in range(200):
+        # Five channels recommended by every source, plus a long tail of one-offs
+        rows += [(f"s{source}", f"hot{i}", 10000) for i in range(5)]
+        rows += [(f"s{source}", f"tail{source}_{i}", 10000) for i in range(20)]
+    random.shuffle(rows)
+
+    ranker = Level2Ranker(top_k=5, max_tracked=50)
+    for source, username, participants_count in rows:
+        ranker.add(source, username, participants_count, username)
+        assert len(ranker.channels) <= 50
+
+    top = ranker.ranked()
+    assert sorted(r["username"] for r in top) == [f"hot{i}" for i in range(5)]
+    assert ranker.evicted > 0
+
+
+def test_max_tracked_by_participants_is_exact():
+    ranker = Level2Ranker(rank_by="participants", top_k=3, max_tracked=3)
+    _feed(ranker, [("a", f"c{i}", 1000 + i) for i in range(100)])
+    assert [r["username"] for r in ranker.ranked()] == ["c99", "c98", "c97"]
+
+
+def test_near_duplicates_without_numpy_fails_at_construction(monkeypatch):
+    monkeypatch.setattr(dedup, "np", None)
+    with pytest.raises(RuntimeError):
+        Level2Ranker(near_duplicates="mark")
+    Level2Ranker()
@@ -0,0 +1,73 @@
+from main import SimilarChannelParser
+from refresh import CrawlState
+
+
+def _fetch(state, source, channels):
+    lines = [f"{username}:{count}:{username}" for username, count in channels]
+    rows = [{"username": username, "participants_count": count, "title": username} for username, count in channels]
+    return state.record_fetch(source, lines, rows)
+
+
+def _age(state, username, hours):
+    state.sources[username.lower()]["fetched_at"] -= hours * 3600
+
+
+def test_first_fetch_has_no_diff_and_is_cached(tmp_path):
+    state = CrawlState(tmp_path / "state.json")
+    assert _fetch(state, "@Seed", [("A", 100), ("B", 200)]) == []
+    state.save()
+
+    state = CrawlState(tmp_path / "state.json")
+    assert state.cached_lines("seed") == ["A:100:A", "B:200:B"]
+    assert not state.is_stale("@SEED", 1)
+    assert state.is_stale("other", 1)
+
+
+def test_diff_reports_added_dropped_and_subscribers_with_original_names(tmp_path):
+    state = CrawlState(tmp_path / "state.json")
+    _fetch(state, "seed", [("Alpha", 100), ("Beta", 200)])
+    diff = _fetch(state, "seed", [("Beta", 250), ("Gamma", 300)])
+
+    assert sorted((r["change"], r["username"], r["old_count"], r["new_count"]) for r in diff) == [
+        ("added", "Gamma", "", 300),
+        ("dropped", "Alpha", 100, ""),
+        ("subscribers", "Beta", 200, 250),
+    ]
+
+
+def test_plan_refresh_orders_by_priority_and_truncates(tmp_path):
+    state = CrawlState(tmp_path / "state.json")
+    for source in ("slow", "fast", "fresh"):
+        _fetch(state, source, [("x", 100)])
+    _fetch(state, "seed", [("slow", 1000), ("fast", 1000)])
+    _fetch(state, "seed", [("slow", 1001), ("fast", 2000)])
+    for source in ("slow", "fast"):
+        _age(state, source, 10)
+
+    usernames = ["slow", "fresh", "new", "fast"]
+    assert state.plan_refresh(usernames, max_age_hours=5) == ["new", "fast", "slow"]
+    assert state.plan_refresh(usernames, max_age_hours=5, max_requests=2) == ["new", "fast"]
+
+
+def test_unchanged_channels_are_refreshed_less_often(tmp_path):
+    state = CrawlState(tmp_path / "state.json")
+    _fetch(state, "stable", [("x", 100)])
+    _fetch(state, "stable", [("x", 150)])  # subscriber changes alone don't count
+    _age(state, "stable", 8)
+    assert state.max_age_hours("stable", 5, max_backoff=3) == 10
+    assert not state.is_stale("stable", 5, max_backoff=3)
+    assert state.is_stale("stable", 5)
+
+    _fetch(state, "stable", [("y", 100)])
+    assert state.max_age_hours("stable", 5, max_backoff=3) == 5
+
+
+def test_empty_fetch_is_not_recorded_and_falls_back_to_cache(tmp_path):
+    state = CrawlState(tmp_path / "state.json")
+    _fetch(state, "seed", [("a", 100)])
+
+    assert SimilarChannelParser.record_fetch(state, "seed", [], []) == []
+    assert state.cached_lines("seed") == ["a:100:a"]
+    assert SimilarChannelParser.fallback_to_cache(state, "seed", [], refresh=True) == ["a:100:a"]
+    assert SimilarChannelParser.fallback_to_cache(state, "seed", [], refresh=False) == []
+    assert SimilarChannelParser.fallback_to_cache(state, "seed", ["b:1:b"], refresh=True) == ["b:1:b"]
@@ -0,0 +1,42 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+import storage
+
+
+def test_gzip_round_trip(tmp_path):
+    path = storage.output_path(tmp_path / "channels.txt", "gzip")
+    assert path.name == "channels.txt.gz"
+    with storage.open_output(path) as file:
+        file.write("a:1:Канал\nb:2:B\n")
+
+    assert gzip.decompress(path.read_bytes()).decode("utf-8") == "a:1:Канал\nb:2:B\n"
+    assert list(storage.iter_lines(path)) == ["a:1:Канал", "b:2:B"]
+
+
+def test_logical_suffix():
+    assert storage.logical_suffix(Path("x.txt.gz")) == ".txt"
+    assert storage.logical_suffix(Path("x.txt.zst")) == ".txt"
+    assert storage.logical_suffix(Path("x.csv")) == ".csv"
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    assert storage.output_path(tmp_path / "x.txt", "") == tmp_path / "x.txt"
+    with pytest.raises(ValueError):
+        storage.output_path(tmp_path / "x.txt", "gz")
+    with pytest.raises(ValueError):
+        storage.check_compression("zip")
+    storage.check_compression("gzip")
+
+
+def test_zstd_round_trip(tmp_path):
+    try:
+        storage._zstd()
+    except RuntimeError:
+        pytest.skip("zstandard is not installed")
+    path = storage.output_path(tmp_path / "channels.txt", "zstd")
+    with storage.open_output(path) as file:
+        file.write("a:1:A\n")
+    assert list(storage.iter_lines(path)) == ["a:1:A"]